@@ -0,0 +1,103 @@
+package main
+
+import (
+	"sync"
+	"time"
+)
+
+type cacheEntry struct {
+	clientID string
+	body     []byte
+	expires  time.Time
+}
+
+// responseCache is a bounded cache for rendered responses with a short TTL.
+// Entries are tagged with the client they belong to ("" for all clients),
+// so new frames only invalidate the affected responses.
+type responseCache struct {
+	mu      sync.Mutex
+	size    int
+	ttl     time.Duration
+	gens    map[string]uint64
+	entries map[string]cacheEntry
+}
+
+func newResponseCache(size int, ttl time.Duration) *responseCache {
+	return &responseCache{
+		size:    size,
+		ttl:     ttl,
+		gens:    make(map[string]uint64),
+		entries: make(map[string]cacheEntry, size),
+	}
+}
+
+func (rc *responseCache) get(key string) ([]byte, bool) {
+	rc.mu.Lock()
+	defer rc.mu.Unlock()
+
+	entry, ok := rc.entries[key]
+	if !ok {
+		return nil, false
+	}
+	if time.Now().After(entry.expires) {
+		delete(rc.entries, key)
+		return nil, false
+	}
+	return entry.body, true
+}
+
+// generation has to be read before querying the database. put discards the
+// response if the client was invalidated in between, as it may be stale.
+func (rc *responseCache) generation(clientID string) uint64 {
+	rc.mu.Lock()
+	defer rc.mu.Unlock()
+	return rc.gens[clientID]
+}
+
+func (rc *responseCache) put(key string, clientID string, body []byte, generation uint64) {
+	rc.mu.Lock()
+	defer rc.mu.Unlock()
+
+	if generation != rc.gens[clientID] {
+		return
+	}
+
+	now := time.Now()
+	if _, ok := rc.entries[key]; !ok && len(rc.entries) >= rc.size {
+		rc.evict(now)
+	}
+	rc.entries[key] = cacheEntry{clientID, body, now.Add(rc.ttl)}
+}
+
+// evict drops all expired entries, or the one expiring next if none are.
+func (rc *responseCache) evict(now time.Time) {
+	var (
+		oldestKey string
+		oldest    time.Time
+	)
+	for key, entry := range rc.entries {
+		if now.After(entry.expires) {
+			delete(rc.entries, key)
+			continue
+		}
+		if oldestKey == "" || entry.expires.Before(oldest) {
+			oldestKey, oldest = key, entry.expires
+		}
+	}
+	if len(rc.entries) >= rc.size {
+		delete(rc.entries, oldestKey)
+	}
+}
+
+func (rc *responseCache) invalidate(clientID string) {
+	rc.mu.Lock()
+	defer rc.mu.Unlock()
+
+	rc.gens[clientID]++
+	rc.gens[""]++
+	for key, entry := range rc.entries {
+		if entry.clientID == clientID || entry.clientID == "" {
+			delete(rc.entries, key)
+		}
+	}
+}
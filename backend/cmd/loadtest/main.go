@@ -0,0 +1,226 @@
+// loadtest replays synthetic packets against a running backend (-mode submit)
+// or polls /frames/recent like a dashboard per client (-mode frames) and
+// reports throughput and latency.
+package main
+
+import (
+	"bytes"
+	"crypto/rand"
+	"crypto/sha256"
+	"encoding/binary"
+	"flag"
+	"fmt"
+	"io/ioutil"
+	"log"
+	"net/http"
+	"sort"
+	"sync"
+	"time"
+)
+
+var (
+	mode        = flag.String("mode", "submit", "submit or frames")
+	baseURL     = flag.String("url", "http://localhost:1919", "backend base URL")
+	requests    = flag.Int("n", 1000, "number of requests to send")
+	concurrency = flag.Int("c", 8, "number of concurrent workers")
+	clientID    = flag.Int("client", 1337, "client ID used in generated packets, first client ID polled")
+	clients     = flag.Int("clients", 50, "number of consecutive client IDs to poll")
+	count       = flag.Int("count", 10, "frames per poll")
+	frameCount  = flag.Int("frames", 30, "frames per packet")
+	wifiCount   = flag.Int("wifis", 5, "wifis per frame")
+	beaconCount = flag.Int("beacons", 20, "beacons per frame")
+)
+
+func main() {
+	flag.Parse()
+
+	switch *mode {
+	case "submit":
+		benchSubmit()
+	case "frames":
+		benchFrames()
+	default:
+		log.Fatalf("unknown mode %q", *mode)
+	}
+}
+
+func benchSubmit() {
+	packets := make([][]byte, *requests)
+	for i := range packets {
+		packets[i] = buildPacket(int16(*clientID), *frameCount, *wifiCount, *beaconCount)
+	}
+
+	// frames reference clients, so every packet fails without the client row
+	check := buildPacket(int16(*clientID), 1, 0, 0)
+	if err := submit(*baseURL+"/submit", check); err != nil {
+		log.Fatalf("test packet failed, does client %d exist in clients? %v", *clientID, err)
+	}
+
+	latencies, wall := run(*requests, func(i int) error {
+		return submit(*baseURL+"/submit", packets[i])
+	})
+
+	report(latencies, wall, map[string]int{
+		"packets": len(latencies),
+		"frames":  len(latencies) * *frameCount,
+		"beacons": len(latencies) * *frameCount * *beaconCount,
+	})
+}
+
+func benchFrames() {
+	latencies, wall := run(*requests, func(i int) error {
+		url := fmt.Sprintf("%s/frames/recent?client_id=%d&count=%d", *baseURL, *clientID+i%*clients, *count)
+		return get(url)
+	})
+
+	report(latencies, wall, map[string]int{
+		"requests": len(latencies),
+	})
+}
+
+// buildPacket encodes a packet the same way the firmware does.
+func buildPacket(clientID int16, frames, wifis, beacons int) []byte {
+	buf := new(bytes.Buffer)
+	buf.Write([]byte("CWA"))
+	binary.Write(buf, binary.BigEndian, uint8(1))
+	binary.Write(buf, binary.BigEndian, clientID)
+	binary.Write(buf, binary.BigEndian, uint8(frames))
+
+	now := time.Now().Unix()
+	for f := 0; f < frames; f++ {
+		binary.Write(buf, binary.BigEndian, int32(now-int64(60*(frames-f))))
+		binary.Write(buf, binary.BigEndian, uint16(40000))
+		binary.Write(buf, binary.BigEndian, int16(20))
+		binary.Write(buf, binary.BigEndian, int16(120))
+		binary.Write(buf, binary.BigEndian, uint8(wifis))
+		binary.Write(buf, binary.BigEndian, uint8(beacons))
+
+		for w := 0; w < wifis; w++ {
+			buf.Write(randomBytes(6))
+			binary.Write(buf, binary.BigEndian, int8(-60))
+		}
+		for b := 0; b < beacons; b++ {
+			buf.Write(randomBytes(20))
+			binary.Write(buf, binary.BigEndian, int8(-80))
+		}
+	}
+
+	checksum := sha256.Sum256(buf.Bytes())
+	buf.Write(checksum[:])
+	return buf.Bytes()
+}
+
+func randomBytes(n int) []byte {
+	b := make([]byte, n)
+	if _, err := rand.Read(b); err != nil {
+		log.Fatal(err)
+	}
+	return b
+}
+
+func submit(url string, packet []byte) error {
+	resp, err := http.Post(url, "application/octet-stream", bytes.NewReader(packet))
+	if err != nil {
+		return err
+	}
+	defer resp.Body.Close()
+
+	body, err := ioutil.ReadAll(resp.Body)
+	if err != nil {
+		return err
+	}
+	if resp.StatusCode != http.StatusOK {
+		return fmt.Errorf("status %d: %s", resp.StatusCode, body)
+	}
+
+	checksum := sha256.Sum256(packet[:len(packet)-sha256.Size])
+	if !bytes.Equal(body, checksum[:]) {
+		return fmt.Errorf("checksum mismatch")
+	}
+	return nil
+}
+
+func get(url string) error {
+	resp, err := http.Get(url)
+	if err != nil {
+		return err
+	}
+	defer resp.Body.Close()
+
+	body, err := ioutil.ReadAll(resp.Body)
+	if err != nil {
+		return err
+	}
+	if resp.StatusCode != http.StatusOK {
+		return fmt.Errorf("status %d: %s", resp.StatusCode, body)
+	}
+	return nil
+}
+
+// run calls do n times with the configured concurrency and returns the
+// latencies of all successful calls and the total wall time.
+func run(n int, do func(int) error) ([]time.Duration, time.Duration) {
+	work := make(chan int)
+	var (
+		mu        sync.Mutex
+		wg        sync.WaitGroup
+		latencies []time.Duration
+		failures  int
+	)
+
+	for i := 0; i < *concurrency; i++ {
+		wg.Add(1)
+		go func() {
+			defer wg.Done()
+			for item := range work {
+				start := time.Now()
+				err := do(item)
+				elapsed := time.Since(start)
+
+				mu.Lock()
+				if err != nil {
+					failures++
+					log.Println(err)
+				} else {
+					latencies = append(latencies, elapsed)
+				}
+				mu.Unlock()
+			}
+		}()
+	}
+
+	start := time.Now()
+	for i := 0; i < n; i++ {
+		work <- i
+	}
+	close(work)
+	wg.Wait()
+	wall := time.Since(start)
+
+	if failures > 0 {
+		log.Printf("%d of %d requests failed", failures, n)
+	}
+	return latencies, wall
+}
+
+func report(latencies []time.Duration, wall time.Duration, counts map[string]int) {
+	if len(latencies) == 0 {
+		log.Fatal("no successful requests")
+	}
+	sort.Slice(latencies, func(i, j int) bool { return latencies[i] < latencies[j] })
+	percentile := func(p float64) time.Duration {
+		return latencies[int(float64(len(latencies)-1)*p)]
+	}
+
+	fmt.Printf("wall time: %s\n", wall)
+	names := make([]string, 0, len(counts))
+	for name := range counts {
+		names = append(names, name)
+	}
+	sort.Strings(names)
+	for _, name := range names {
+		fmt.Printf("%-9s %10d  %10.1f/s\n", name, counts[name], float64(counts[name])/wall.Seconds())
+	}
+	fmt.Printf("latency p50=%s p95=%s p99=%s max=%s\n",
+		percentile(0.50), percentile(0.95), percentile(0.99), latencies[len(latencies)-1])
+}
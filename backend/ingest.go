@@ -0,0 +1,110 @@
+package main
+
+import (
+	"context"
+	"fmt"
+	"time"
+
+	"github.com/jackc/pgx/v4"
+)
+
+// insertPacket stores all frames and beacons of a packet in a single
+// transaction. Frame IDs are reserved from the identity sequence in one
+// round-trip, so frames and beacons can both be sent with COPY.
+func insertPacket(ctx context.Context, packet packet_t) error {
+	if len(packet.Frames) == 0 {
+		return nil
+	}
+
+	tx, err := dbpool.Begin(ctx)
+	if err != nil {
+		return fmt.Errorf("ingest - begin failed: %s", err)
+	}
+	defer tx.Rollback(ctx)
+
+	frameIDs, err := reserveFrameIDs(ctx, tx, len(packet.Frames))
+	if err != nil {
+		return err
+	}
+
+	frameRows := make([][]interface{}, 0, len(packet.Frames))
+	var beaconRows [][]interface{}
+	for i, frame := range packet.Frames {
+		var wifis []wifi_go_t
+		for _, w := range frame.Wifis {
+			wifis = append(wifis, w.toGoType())
+		}
+
+		frameRows = append(frameRows, []interface{}{
+			frameIDs[i],
+			packet.Header.ClientID,
+			time.Unix(int64(frame.Header.TimeStamp), 0),
+			frame.Header.BatteryStatus,
+			frame.Header.HallSensor,
+			frame.Header.TemperaturSensor,
+			wifis,
+			frame.Header.BeaconCount,
+		})
+
+		for _, b := range frame.Beacons {
+			bg := b.toGoType()
+			beaconRows = append(beaconRows, []interface{}{bg.Data, bg.RSSI, frameIDs[i]})
+		}
+	}
+
+	if _, err := tx.CopyFrom(ctx, pgx.Identifier{"frames"}, []string{
+		"id",
+		"client_id",
+		"timestamp",
+		"battery",
+		"hall_sensor",
+		"temperatur_sensor",
+		"wifis",
+		"beacon_count",
+	}, pgx.CopyFromRows(frameRows)); err != nil {
+		return fmt.Errorf("ingest - frames copy failed: %s", err)
+	}
+
+	if len(beaconRows) > 0 {
+		if _, err := tx.CopyFrom(ctx, pgx.Identifier{"beacons"}, []string{
+			"data",
+			"rssi",
+			"frame_id",
+		}, pgx.CopyFromRows(beaconRows)); err != nil {
+			return fmt.Errorf("ingest - beacons copy failed: %s", err)
+		}
+	}
+
+	if err := tx.Commit(ctx); err != nil {
+		return fmt.Errorf("ingest - commit failed: %s", err)
+	}
+
+	return nil
+}
+
+// reserveFrameIDs draws n values from the frames identity sequence.
+func reserveFrameIDs(ctx context.Context, tx pgx.Tx, n int) ([]int32, error) {
+	rows, err := tx.Query(ctx, `SELECT nextval(pg_get_serial_sequence('frames', 'id'))::INTEGER
+	FROM generate_series(1, $1)`, n)
+	if err != nil {
+		return nil, fmt.Errorf("ingest - reserving frame ids failed: %s", err)
+	}
+	defer rows.Close()
+
+	ids := make([]int32, 0, n)
+	for rows.Next() {
+		var id int32
+		if err := rows.Scan(&id); err != nil {
+			return nil, fmt.Errorf("ingest - reserving frame ids failed: %s", err)
+		}
+		ids = append(ids, id)
+	}
+	if err := rows.Err(); err != nil {
+		return nil, fmt.Errorf("ingest - reserving frame ids failed: %s", err)
+	}
+	if len(ids) != n {
+		return nil, fmt.Errorf("ingest - reserved %d frame ids, wanted %d", len(ids), n)
+	}
+
+	return ids, nil
+}
@@ -4,16 +4,18 @@ import (
 	"context"
 	"crypto/sha256"
 	"encoding/hex"
+	"encoding/json"
+	"fmt"
 	"log"
 	"net/http"
 	"os"
+	"strconv"
 	"strings"
 	"text/template"
 	"time"
 
 	"github.com/gin-contrib/cors"
 	"github.com/gin-gonic/gin"
-	"github.com/jackc/pgx/v4"
 	"github.com/jackc/pgx/v4/pgxpool"
 )
 
@@ -33,6 +35,7 @@ OTA_INTERVAL = {{.OtaInterval}}  # OTA every N uploads
 MAX_PACKET_SIZE = {{.MaxPacketSize}}  # bytes
 MAX_FRAMES_PER_PACKET = {{.MaxFramesPerPacket}}
 EMPTY_WIFI_THRESHOLD = {{.EmptyWifiThreshold}}  # after N scans with no wifis, use EXTENDED_SLEEP_TIME
+LOG_URL = "{{.LogURL}}"
 
 SSID_EXCLUDE_PREFIX = [
     "AndroidAP",
@@ -248,10 +251,18 @@ DEPOT_MACS = [
 ]
 `
 
+const (
+	FRAMES_DEFAULT_COUNT = 10
+	FRAMES_MAX_COUNT     = 1000
+	FRAMES_CACHE_SIZE    = 1024
+	FRAMES_CACHE_TTL     = 5 * time.Second
+)
+
 var (
-	tpl    *template.Template
-	dbpool *pgxpool.Pool
-	err    error
+	tpl         *template.Template
+	dbpool      *pgxpool.Pool
+	framesCache = newResponseCache(FRAMES_CACHE_SIZE, FRAMES_CACHE_TTL)
+	err         error
 )
 
 func main() {
@@ -263,15 +274,19 @@ func main() {
 	}
 	defer dbpool.Close()
 
+	go refreshRollups()
+
 	router := gin.Default()
 	router.Use(cors.Default())
 
 	// API Endpoints
 	router.GET("/frames/recent", recentFramesHandle)
+	router.GET("/frames/rollups", rollupsHandle)
 
 	// Firmware Endpoints
 	router.GET("/ota/config", configOtaHandle)
 	router.POST("/submit", submitHandle)
+	router.POST("/logs", logsHandle)
 
 	if err := router.Run(":1919"); err != nil {
 		log.Fatal(err)
@@ -280,18 +295,76 @@ func main() {
 
 func recentFramesHandle(c *gin.Context) {
 	clientID := c.Query("client_id")
-	count := c.Query("count")
-	showAllClients := false
+	if clientID != "" {
+		id, err := strconv.ParseInt(clientID, 10, 32)
+		if err != nil {
+			c.String(http.StatusBadRequest, "Invalid client_id.")
+			return
+		}
+		clientID = strconv.FormatInt(id, 10)
+	}
 
-	if clientID == "" {
-		clientID = "0"
-		showAllClients = true
+	count := FRAMES_DEFAULT_COUNT
+	if s := c.Query("count"); s != "" {
+		n, err := strconv.Atoi(s)
+		if err != nil || n < 1 {
+			c.String(http.StatusBadRequest, "Invalid count.")
+			return
+		}
+		if n > FRAMES_MAX_COUNT {
+			n = FRAMES_MAX_COUNT
+		}
+		count = n
+	}
+
+	before, err := parseCursor(c, "before")
+	if err != nil {
+		c.String(http.StatusBadRequest, err.Error())
+		return
+	}
+	after, err := parseCursor(c, "after")
+	if err != nil {
+		c.String(http.StatusBadRequest, err.Error())
+		return
+	}
+
+	cacheKey := fmt.Sprintf("%s|%d|%v|%v", clientID, count, before, after)
+	if body, ok := framesCache.get(cacheKey); ok {
+		c.Data(http.StatusOK, "application/json; charset=utf-8", body)
+		return
+	}
+	generation := framesCache.generation(clientID)
+
+	// (timestamp, id) is unique, so it can be used as keyset for paging in
+	// both directions. Pages after a cursor are read in ascending order and
+	// reversed below, so results are always newest first.
+	var (
+		conditions []string
+		args       []interface{}
+	)
+	if clientID != "" {
+		args = append(args, clientID)
+		conditions = append(conditions, fmt.Sprintf("client_id = $%d", len(args)))
+	}
+	if before != nil {
+		args = append(args, before.Timestamp, before.ID)
+		conditions = append(conditions, fmt.Sprintf("(timestamp, id) < ($%d, $%d)", len(args)-1, len(args)))
 	}
-	if count == "" {
-		count = "10"
+	if after != nil {
+		args = append(args, after.Timestamp, after.ID)
+		conditions = append(conditions, fmt.Sprintf("(timestamp, id) > ($%d, $%d)", len(args)-1, len(args)))
 	}
+	order := "DESC"
+	if after != nil && before == nil {
+		order = "ASC"
+	}
+	where := ""
+	if len(conditions) > 0 {
+		where = "WHERE " + strings.Join(conditions, " AND ")
+	}
+	args = append(args, count)
 
-	rows, err := dbpool.Query(context.Background(), `SELECT
+	rows, err := dbpool.Query(context.Background(), fmt.Sprintf(`SELECT
 		id,
 		client_id,
 		timestamp,
@@ -302,35 +375,34 @@ func recentFramesHandle(c *gin.Context) {
 		beacon_count,
 		received_timestamp
 	FROM frames
-	WHERE client_id = $1 OR $2
-	ORDER BY timestamp DESC
-	LIMIT $3`, clientID, showAllClients, count)
+	%s
+	ORDER BY timestamp %s, id %s
+	LIMIT $%d`, where, order, order, len(args)), args...)
 	if err != nil {
-		if err == pgx.ErrNoRows {
-			c.JSON(http.StatusNoContent, nil)
-			return
-		}
-
 		log.Println(err)
 		c.JSON(http.StatusInternalServerError, nil)
 		return
 	}
+	defer rows.Close()
 
 	type frame struct {
-		ID                uint        `json:"id"`
-		ClientID          uint        `json:"client_id"`
-		Timestamp         time.Time   `json:"timestamp"`
-		Battery           uint        `json:"battery"`
-		HallSensor        int         `json:"hall_sensor"`
-		TemperaturSensor  int         `json:"temperatur_sensor"`
-		Wifis             []wifi_go_t `json:"wifis"`
-		BeaconCount       uint        `json:"beacon_count"`
-		ReceivedTimestamp time.Time   `json:"received_timestamp"`
+		ID                uint            `json:"id"`
+		ClientID          uint            `json:"client_id"`
+		Timestamp         time.Time       `json:"timestamp"`
+		Battery           uint            `json:"battery"`
+		HallSensor        int             `json:"hall_sensor"`
+		TemperaturSensor  int             `json:"temperatur_sensor"`
+		Wifis             json.RawMessage `json:"wifis"`
+		BeaconCount       uint            `json:"beacon_count"`
+		ReceivedTimestamp time.Time       `json:"received_timestamp"`
 	}
 
 	var frames []frame
 	for rows.Next() {
-		var f frame
+		var (
+			f     frame
+			wifis []byte
+		)
 		if err := rows.Scan(
 			&f.ID,
 			&f.ClientID,
@@ -338,7 +410,7 @@ func recentFramesHandle(c *gin.Context) {
 			&f.Battery,
 			&f.HallSensor,
 			&f.TemperaturSensor,
-			&f.Wifis,
+			&wifis,
 			&f.BeaconCount,
 			&f.ReceivedTimestamp,
 		); err != nil {
@@ -346,10 +418,61 @@ func recentFramesHandle(c *gin.Context) {
 			c.JSON(http.StatusInternalServerError, nil)
 			return
 		}
+		// passed through as stored, pgx copies []byte without decoding
+		f.Wifis = json.RawMessage(wifis)
 		frames = append(frames, f)
 	}
+	if err := rows.Err(); err != nil {
+		log.Println(err)
+		c.JSON(http.StatusInternalServerError, nil)
+		return
+	}
+
+	if order == "ASC" {
+		for i, j := 0, len(frames)-1; i < j; i, j = i+1, j-1 {
+			frames[i], frames[j] = frames[j], frames[i]
+		}
+	}
+
+	body, err := json.Marshal(frames)
+	if err != nil {
+		log.Println(err)
+		c.JSON(http.StatusInternalServerError, nil)
+		return
+	}
+	framesCache.put(cacheKey, clientID, body, generation)
+
+	c.Data(http.StatusOK, "application/json; charset=utf-8", body)
+}
+
+type frameCursor struct {
+	Timestamp time.Time
+	ID        int32
+}
 
-	c.JSON(http.StatusOK, frames)
+func (fc *frameCursor) String() string {
+	return fmt.Sprintf("%d,%d", fc.Timestamp.Unix(), fc.ID)
+}
+
+// parseCursor reads <name>_timestamp (unix seconds) and <name>_id.
+func parseCursor(c *gin.Context, name string) (*frameCursor, error) {
+	ts, id := c.Query(name+"_timestamp"), c.Query(name+"_id")
+	if ts == "" && id == "" {
+		return nil, nil
+	}
+
+	seconds, err := strconv.ParseInt(ts, 10, 64)
+	if err != nil {
+		return nil, fmt.Errorf("Invalid %s_timestamp.", name)
+	}
+	cursor := frameCursor{Timestamp: time.Unix(seconds, 0).UTC()}
+	cursorID, err := strconv.ParseInt(id, 10, 32)
+	if err != nil {
+		return nil, fmt.Errorf("Invalid %s_id.", name)
+	}
+	cursor.ID = int32(cursorID)
+
+	return &cursor, nil
 }
 
 func configOtaHandle(c *gin.Context) {
@@ -373,7 +496,8 @@ func configOtaHandle(c *gin.Context) {
 		ota_interval,
 		max_packet_size,
 		max_frames_per_packet,
-		empty_wifi_threshold
+		empty_wifi_threshold,
+		log_url
 	FROM clients WHERE id = $1`, clientID)
 	var clientConfig struct {
 		ID                 uint
@@ -390,6 +514,7 @@ func configOtaHandle(c *gin.Context) {
 		MaxPacketSize      uint
 		MaxFramesPerPacket uint
 		EmptyWifiThreshold uint
+		LogURL             string
 	}
 	if err := row.Scan(
 		&clientConfig.ID,
@@ -406,6 +531,7 @@ func configOtaHandle(c *gin.Context) {
 		&clientConfig.MaxPacketSize,
 		&clientConfig.MaxFramesPerPacket,
 		&clientConfig.EmptyWifiThreshold,
+		&clientConfig.LogURL,
 	); err != nil {
 		log.Println(err)
 		c.String(http.StatusInternalServerError, "Scanning row failed.")
@@ -438,41 +564,63 @@ func submitHandle(c *gin.Context) {
 		return
 	}
 
-	for _, frame := range packet.Frames {
-		var wifis []wifi_go_t
-		for _, w := range frame.Wifis {
-			wifis = append(wifis, w.toGoType())
-		}
-
-		row := dbpool.QueryRow(context.Background(), `INSERT INTO frames(
-			client_id,
-			timestamp,
-			battery,
-			hall_sensor,
-			temperatur_sensor,
-			wifis,
-			beacon_count
-			) VALUES ($1, $2, $3, $4, $5, $6, $7) RETURNING id`,
-			packet.Header.ClientID,
-			time.Unix(int64(frame.Header.TimeStamp), 0),
-			frame.Header.BatteryStatus,
-			frame.Header.HallSensor,
-			frame.Header.TemperaturSensor,
-			wifis,
-			frame.Header.BeaconCount,
-		)
-		var frameID int64
-		if err := row.Scan(&frameID); err != nil && err == pgx.ErrNoRows {
-			log.Println(err)
-		}
+	if err := insertPacket(context.Background(), packet); err != nil {
+		log.Println(err)
+		c.String(http.StatusInternalServerError, "Storing packet failed.")
+		return
+	}
+	framesCache.invalidate(strconv.Itoa(int(packet.Header.ClientID)))
 
-		for _, b := range frame.Beacons {
-			bg := b.toGoType()
-			if _, err := dbpool.Exec(context.Background(), "INSERT INTO beacons(data, rssi, frame_id) VALUES ($1, $2, $3)", bg.Data, bg.RSSI, frameID); err != nil {
-				log.Println(err)
-			}
-		}
+	// ask the device for its log records, they are uploaded right after
+	var uploadLogs bool
+	if err := dbpool.QueryRow(context.Background(), "SELECT EXISTS(SELECT 1 FROM clients WHERE id = $1 AND upload_logs)", packet.Header.ClientID).Scan(&uploadLogs); err != nil {
+		log.Println(err)
+	}
+	if uploadLogs {
+		c.Header("Upload-Logs", "1")
 	}
 
 	c.Data(http.StatusOK, "application/octet-stream", packet.Checksum[:])
 }
+
+// uploads are the records of firmware/log.py without the ring header
+const (
+	LOG_RECORD_SIZE = 11
+	LOG_MAX_SIZE    = 160 * LOG_RECORD_SIZE
+)
+
+func logsHandle(c *gin.Context) {
+	clientID := c.Query("client_id")
+	if clientID == "" {
+		c.String(http.StatusBadRequest, "Client ID missing.")
+		return
+	}
+	if _, err := strconv.ParseInt(clientID, 10, 32); err != nil {
+		c.String(http.StatusBadRequest, "Invalid client_id.")
+		return
+	}
+
+	c.Request.Body = http.MaxBytesReader(c.Writer, c.Request.Body, LOG_MAX_SIZE)
+	payload, err := c.GetRawData()
+	if err != nil {
+		c.String(http.StatusRequestEntityTooLarge, "Logs too large.")
+		return
+	}
+	if len(payload)%LOG_RECORD_SIZE != 0 {
+		c.String(http.StatusBadRequest, "Can't decode logs.")
+		return
+	}
+
+	if _, err := dbpool.Exec(context.Background(), "INSERT INTO client_logs(client_id, data) VALUES ($1, $2)", clientID, payload); err != nil {
+		log.Println(err)
+		c.String(http.StatusInternalServerError, "Storing logs failed.")
+		return
+	}
+
+	// logs are uploaded on request only, see submitHandle
+	if _, err := dbpool.Exec(context.Background(), "UPDATE clients SET upload_logs = FALSE WHERE id = $1", clientID); err != nil {
+		log.Println(err)
+	}
+
+	c.Status(http.StatusOK)
+}
@@ -0,0 +1,154 @@
+package main
+
+import (
+	"context"
+	"log"
+	"net/http"
+	"strconv"
+	"time"
+
+	"github.com/gin-gonic/gin"
+)
+
+const (
+	ROLLUP_REFRESH_INTERVAL = time.Minute
+	ROLLUPS_MAX_BUCKETS     = 2016 // per client, a week of 5-minute buckets
+	ROLLUPS_MAX_COUNT       = 10000
+)
+
+var rollupResolutions = map[string]int{
+	"5m": 300,
+	"1h": 3600,
+}
+
+// refreshRollups periodically folds newly received frames into
+// frame_rollups, see refresh_frame_rollups() in schema.sql.
+func refreshRollups() {
+	for range time.Tick(ROLLUP_REFRESH_INTERVAL) {
+		var refreshed int
+		if err := dbpool.QueryRow(context.Background(), "SELECT refresh_frame_rollups()").Scan(&refreshed); err != nil {
+			log.Println(err)
+		}
+	}
+}
+
+func rollupsHandle(c *gin.Context) {
+	clientID := c.Query("client_id")
+	if clientID != "" {
+		id, err := strconv.ParseInt(clientID, 10, 32)
+		if err != nil {
+			c.String(http.StatusBadRequest, "Invalid client_id.")
+			return
+		}
+		clientID = strconv.FormatInt(id, 10)
+	}
+
+	width, ok := rollupResolutions[c.DefaultQuery("resolution", "5m")]
+	if !ok {
+		c.String(http.StatusBadRequest, "Unknown resolution.")
+		return
+	}
+
+	to := time.Now().UTC()
+	if s := c.Query("to"); s != "" {
+		ts, err := strconv.ParseInt(s, 10, 64)
+		if err != nil {
+			c.String(http.StatusBadRequest, "Invalid to.")
+			return
+		}
+		to = time.Unix(ts, 0).UTC()
+	}
+	from := to.Add(-24 * time.Hour)
+	if s := c.Query("from"); s != "" {
+		ts, err := strconv.ParseInt(s, 10, 64)
+		if err != nil {
+			c.String(http.StatusBadRequest, "Invalid from.")
+			return
+		}
+		from = time.Unix(ts, 0).UTC()
+	}
+	if !from.Before(to) {
+		c.String(http.StatusBadRequest, "from has to be before to.")
+		return
+	}
+	if to.Sub(from) > time.Duration(width*ROLLUPS_MAX_BUCKETS)*time.Second {
+		c.String(http.StatusBadRequest, "Range too large.")
+		return
+	}
+
+	const columns = `SELECT
+		client_id,
+		bucket_width,
+		bucket_start,
+		frame_count,
+		beacon_count_mean,
+		beacon_count_max,
+		distinct_rpi_count,
+		battery_first,
+		battery_last,
+		battery_slope
+	FROM frame_rollups`
+
+	query := columns + `
+	WHERE bucket_width = $1 AND bucket_start >= $2 AND bucket_start < $3
+	ORDER BY bucket_start, client_id
+	LIMIT $4`
+	args := []interface{}{width, from, to, ROLLUPS_MAX_COUNT}
+	if clientID != "" {
+		query = columns + `
+		WHERE client_id = $5 AND bucket_width = $1 AND bucket_start >= $2 AND bucket_start < $3
+		ORDER BY bucket_start
+		LIMIT $4`
+		args = append(args, clientID)
+	}
+
+	rows, err := dbpool.Query(context.Background(), query, args...)
+	if err != nil {
+		log.Println(err)
+		c.JSON(http.StatusInternalServerError, nil)
+		return
+	}
+	defer rows.Close()
+
+	type rollup struct {
+		ClientID         uint      `json:"client_id"`
+		BucketWidth      uint      `json:"bucket_width"`
+		BucketStart      time.Time `json:"bucket_start"`
+		FrameCount       uint      `json:"frame_count"`
+		BeaconCountMean  *float64  `json:"beacon_count_mean"`
+		BeaconCountMax   *uint     `json:"beacon_count_max"`
+		DistinctRPICount uint      `json:"distinct_rpi_count"`
+		BatteryFirst     uint      `json:"battery_first"`
+		BatteryLast      uint      `json:"battery_last"`
+		BatterySlope     *float64  `json:"battery_slope"`
+	}
+
+	rollups := []rollup{}
+	for rows.Next() {
+		var r rollup
+		if err := rows.Scan(
+			&r.ClientID,
+			&r.BucketWidth,
+			&r.BucketStart,
+			&r.FrameCount,
+			&r.BeaconCountMean,
+			&r.BeaconCountMax,
+			&r.DistinctRPICount,
+			&r.BatteryFirst,
+			&r.BatteryLast,
+			&r.BatterySlope,
+		); err != nil {
+			log.Println(err)
+			c.JSON(http.StatusInternalServerError, nil)
+			return
+		}
+		rollups = append(rollups, r)
+	}
+	if err := rows.Err(); err != nil {
+		log.Println(err)
+		c.JSON(http.StatusInternalServerError, nil)
+		return
+	}
+
+	c.JSON(http.StatusOK, rollups)
+}
@@ -50,3 +50,141 @@ CREATE TABLE beacons (
 	key_id INTEGER REFERENCES keys
 );
 CREATE INDEX beacons_idx_data ON beacons (data);
+
+ALTER TABLE keys ADD COLUMN rolling_start_interval_number INTEGER;
+ALTER TABLE keys ADD COLUMN rolling_period INTEGER NOT NULL DEFAULT 144;
+
+CREATE TABLE matcher_state (
+	id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+	last_key_id INTEGER NOT NULL DEFAULT 0,
+	last_received_timestamp TIMESTAMPTZ NOT NULL DEFAULT 'epoch'
+);
+INSERT INTO matcher_state DEFAULT VALUES;
+
+CREATE INDEX beacons_idx_frame_id ON beacons (frame_id);
+
+CREATE INDEX frames_idx_received_timestamp ON frames (received_timestamp);
+
+CREATE TABLE frame_rollups (
+	client_id INTEGER NOT NULL REFERENCES clients,
+	bucket_width INTEGER NOT NULL, -- seconds
+	bucket_start TIMESTAMP NOT NULL,
+	frame_count INTEGER NOT NULL,
+	beacon_count_mean DOUBLE PRECISION,
+	beacon_count_max INTEGER,
+	distinct_rpi_count INTEGER NOT NULL,
+	battery_first INTEGER NOT NULL,
+	battery_last INTEGER NOT NULL,
+	battery_slope DOUBLE PRECISION, -- per hour
+	updated_timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+	PRIMARY KEY (client_id, bucket_width, bucket_start)
+);
+
+CREATE TABLE rollup_state (
+	id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+	last_received_timestamp TIMESTAMPTZ NOT NULL DEFAULT '-infinity'
+);
+INSERT INTO rollup_state DEFAULT VALUES;
+
+-- Recomputes every bucket touched by frames received since the last run.
+-- Buckets are keyed by the frame timestamp, so late uploads update old
+-- buckets. Frames are only picked up once they are older than settle, which
+-- gives ingest transactions (received_timestamp = transaction start) time
+-- to commit.
+CREATE FUNCTION refresh_frame_rollups(settle INTERVAL DEFAULT '1 minute') RETURNS INTEGER AS $$
+DECLARE
+	since TIMESTAMPTZ;
+	upto TIMESTAMPTZ := NOW() - settle;
+	refreshed INTEGER;
+BEGIN
+	SELECT last_received_timestamp INTO since FROM rollup_state FOR UPDATE;
+	IF upto <= since THEN
+		RETURN 0;
+	END IF;
+
+	WITH touched AS (
+		SELECT DISTINCT
+			f.client_id,
+			w.width,
+			'epoch'::TIMESTAMP + floor(EXTRACT(EPOCH FROM f.timestamp) / w.width) * w.width * INTERVAL '1 second' AS bucket_start
+		FROM frames f
+		CROSS JOIN (VALUES (300), (3600)) AS w (width)
+		WHERE f.received_timestamp > since
+		AND f.received_timestamp <= upto
+		AND f.client_id IS NOT NULL
+	)
+	INSERT INTO frame_rollups (
+		client_id,
+		bucket_width,
+		bucket_start,
+		frame_count,
+		beacon_count_mean,
+		beacon_count_max,
+		distinct_rpi_count,
+		battery_first,
+		battery_last,
+		battery_slope
+	)
+	SELECT
+		t.client_id,
+		t.width,
+		t.bucket_start,
+		s.frame_count,
+		s.beacon_count_mean,
+		s.beacon_count_max,
+		r.distinct_rpi_count,
+		s.battery_first,
+		s.battery_last,
+		s.battery_slope
+	FROM touched t
+	CROSS JOIN LATERAL (
+		SELECT
+			COUNT(*) AS frame_count,
+			AVG(f.beacon_count) AS beacon_count_mean,
+			MAX(f.beacon_count) AS beacon_count_max,
+			(array_agg(f.battery ORDER BY f.timestamp ASC))[1] AS battery_first,
+			(array_agg(f.battery ORDER BY f.timestamp DESC))[1] AS battery_last,
+			regr_slope(f.battery, EXTRACT(EPOCH FROM f.timestamp)) * 3600 AS battery_slope
+		FROM frames f
+		WHERE f.client_id = t.client_id
+		AND f.timestamp >= t.bucket_start
+		AND f.timestamp < t.bucket_start + t.width * INTERVAL '1 second'
+	) s
+	CROSS JOIN LATERAL (
+		SELECT COUNT(DISTINCT substr(b.data, 1, 32)) AS distinct_rpi_count -- RPI without metadata
+		FROM frames f
+		JOIN beacons b ON b.frame_id = f.id
+		WHERE f.client_id = t.client_id
+		AND f.timestamp >= t.bucket_start
+		AND f.timestamp < t.bucket_start + t.width * INTERVAL '1 second'
+	) r
+	ON CONFLICT (client_id, bucket_width, bucket_start) DO UPDATE SET
+		frame_count = EXCLUDED.frame_count,
+		beacon_count_mean = EXCLUDED.beacon_count_mean,
+		beacon_count_max = EXCLUDED.beacon_count_max,
+		distinct_rpi_count = EXCLUDED.distinct_rpi_count,
+		battery_first = EXCLUDED.battery_first,
+		battery_last = EXCLUDED.battery_last,
+		battery_slope = EXCLUDED.battery_slope,
+		updated_timestamp = NOW();
+	GET DIAGNOSTICS refreshed = ROW_COUNT;
+
+	UPDATE rollup_state SET last_received_timestamp = upto;
+	RETURN refreshed;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE INDEX frames_idx_client_id_timestamp ON frames (client_id, timestamp, id);
+CREATE INDEX frames_idx_timestamp_id ON frames (timestamp, id);
+DROP INDEX frames_idx_client_id;
+DROP INDEX frames_idx_timestamp;
+
+ALTER TABLE clients ADD COLUMN log_url TEXT NOT NULL DEFAULT 'http://backend:1919/logs';
+ALTER TABLE clients ADD COLUMN upload_logs BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE TABLE client_logs (
+	id INTEGER PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+	client_id INTEGER REFERENCES clients,
+	received_timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+	data BYTEA NOT NULL -- log records as in firmware/log.py
+);
@@ -1,6 +1,6 @@
 import gc
 
-import util
+import log
 import uuurequests
 
 
@@ -57,7 +57,7 @@ def accept_captive_portal() -> bool:
             "User-Agent": "Mozilla/5.0 (iPhone; CPU OS 12_4_8 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) FxiOS/29.0  Mobile/15E148 Safari/605.1.15",
         }
 
-        util.syslog("Captive Portal BVG", "Portal detected")
+        log.info(log.PORTAL_DETECTED)
 
         gc.collect()
         loginReqest = uuurequests.request(
@@ -69,7 +69,7 @@ def accept_captive_portal() -> bool:
         loginResponse = loginReqest.text
         gc.collect()
 
-        util.syslog("Captive Portal BVG", "Submitted first stage of captive portal")
+        log.debug(log.PORTAL_FIRST_STAGE)
 
         redirectSearch = '<meta http-equiv="refresh" content="0;url='
         redirectStartIndex = loginResponse.find(redirectSearch) + len(redirectSearch)
@@ -78,24 +78,19 @@ def accept_captive_portal() -> bool:
         redirectUrl = redirectUrl.replace("&amp;", "&")
         gc.collect()
 
-        util.syslog(
-            "Captive Portal BVG",
-            "Detected URL for second stage. Submitting request (probably to local router)",
-        )
+        # submit second stage (probably to local router)
+        log.debug(log.PORTAL_SECOND_STAGE)
 
         try:
             uuurequests.get(redirectUrl)
             gc.collect()
         except Exception:
-            util.syslog(
-                "Captive Portal BVG",
-                "Problem open second stage of captive portal login",
-            )
+            log.warning(log.PORTAL_ERROR)
             return False
 
-        util.syslog("Captive Portal BVG", "Successfully logged into captive portal")
+        log.info(log.PORTAL_LOGGED_IN)
         return True
 
     else:
-        util.syslog("Captive Portal BVG", "No captive portal in place")
+        log.info(log.PORTAL_NONE)
         return True
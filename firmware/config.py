@@ -12,6 +12,7 @@ OTA_INTERVAL = 10  # OTA every N uploads
 MAX_PACKET_SIZE = 10000  # bytes
 MAX_FRAMES_PER_PACKET = 30
 EMPTY_WIFI_THRESHOLD = 10  # after N scans with no wifis, use EXTENDED_SLEEP_TIME
+LOG_URL = "http://backend:1919/logs"
 
 SSID_EXCLUDE_PREFIX = [
     "AndroidAP",
@@ -0,0 +1,185 @@
+from micropython import const
+import ustruct
+import utime
+
+DEBUG = const(10)
+INFO = const(20)
+WARNING = const(30)
+ERROR = const(40)
+OFF = const(100)
+
+# Calls below this level are bound to a no-op at import, so they cost a
+# function call and nothing else. Set at build time.
+LEVEL = const(20)
+
+# event codes, arguments in comments
+BOOT = const(1)  # client id, reset cause
+RTC_CLEAN = const(2)
+BLE_START = const(3)
+BLE_DONE = const(4)  # beacon count
+WIFI_START = const(5)
+WIFI_SCANNED = const(6)  # networks after filtering
+WIFI_STOP = const(7)
+WIFI_CONNECT = const(8)
+WIFI_CONNECTED = const(9)
+WIFI_TIMEOUT = const(10)
+STORAGE_STORE = const(11)  # frame bytes
+STORAGE_DONE = const(12)
+STORAGE_ERROR = const(13)  # errno
+STORAGE_FLUSH = const(14)
+NETWORK_ONLINE = const(15)
+NETWORK_OFFLINE = const(16)
+NETWORK_ERROR = const(17)
+PORTAL_NONE = const(18)
+PORTAL_DETECTED = const(19)
+PORTAL_FIRST_STAGE = const(20)
+PORTAL_SECOND_STAGE = const(21)
+PORTAL_LOGGED_IN = const(22)
+PORTAL_ERROR = const(23)
+TIME_SYNCED = const(24)
+TIME_ERROR = const(25)  # errno
+OTA_UPDATED = const(26)
+OTA_HASH_MISMATCH = const(27)  # status code
+OTA_ERROR = const(28)  # errno
+UPLOAD_START = const(29)
+UPLOAD_PACKET = const(30)  # packet bytes, frames
+UPLOAD_DONE = const(31)  # frames
+UPLOAD_ERROR = const(32)  # errno
+UPLOAD_NO_CONNECTION = const(33)
+UPLOAD_PENDING = const(34)  # remaining wakeups
+UPLOAD_OVERDUE = const(35)  # failed tries
+LOG_UPLOADED = const(36)  # records
+GENERAL_ERROR = const(37)  # errno
+SLEEP = const(38)  # seconds
+LOG_UPLOAD_ERROR = const(39)  # errno
+
+NAMES = {
+    BOOT: "BOOT",
+    RTC_CLEAN: "RTC_CLEAN",
+    BLE_START: "BLE_START",
+    BLE_DONE: "BLE_DONE",
+    WIFI_START: "WIFI_START",
+    WIFI_SCANNED: "WIFI_SCANNED",
+    WIFI_STOP: "WIFI_STOP",
+    WIFI_CONNECT: "WIFI_CONNECT",
+    WIFI_CONNECTED: "WIFI_CONNECTED",
+    WIFI_TIMEOUT: "WIFI_TIMEOUT",
+    STORAGE_STORE: "STORAGE_STORE",
+    STORAGE_DONE: "STORAGE_DONE",
+    STORAGE_ERROR: "STORAGE_ERROR",
+    STORAGE_FLUSH: "STORAGE_FLUSH",
+    NETWORK_ONLINE: "NETWORK_ONLINE",
+    NETWORK_OFFLINE: "NETWORK_OFFLINE",
+    NETWORK_ERROR: "NETWORK_ERROR",
+    PORTAL_NONE: "PORTAL_NONE",
+    PORTAL_DETECTED: "PORTAL_DETECTED",
+    PORTAL_FIRST_STAGE: "PORTAL_FIRST_STAGE",
+    PORTAL_SECOND_STAGE: "PORTAL_SECOND_STAGE",
+    PORTAL_LOGGED_IN: "PORTAL_LOGGED_IN",
+    PORTAL_ERROR: "PORTAL_ERROR",
+    TIME_SYNCED: "TIME_SYNCED",
+    TIME_ERROR: "TIME_ERROR",
+    OTA_UPDATED: "OTA_UPDATED",
+    OTA_HASH_MISMATCH: "OTA_HASH_MISMATCH",
+    OTA_ERROR: "OTA_ERROR",
+    UPLOAD_START: "UPLOAD_START",
+    UPLOAD_PACKET: "UPLOAD_PACKET",
+    UPLOAD_DONE: "UPLOAD_DONE",
+    UPLOAD_ERROR: "UPLOAD_ERROR",
+    UPLOAD_NO_CONNECTION: "UPLOAD_NO_CONNECTION",
+    UPLOAD_PENDING: "UPLOAD_PENDING",
+    UPLOAD_OVERDUE: "UPLOAD_OVERDUE",
+    LOG_UPLOADED: "LOG_UPLOADED",
+    GENERAL_ERROR: "GENERAL_ERROR",
+    SLEEP: "SLEEP",
+    LOG_UPLOAD_ERROR: "LOG_UPLOAD_ERROR",
+}
+
+# record: event, milliseconds since wakeup (wrapping), two arguments
+RECORD_FORMAT = ">BHii"
+RECORD_SIZE = const(11)
+CAPACITY = const(160)  # records, fits into RTC-RAM next to the counters
+
+_HEADER_FORMAT = ">HH"  # next record, record count
+_HEADER_SIZE = const(4)
+
+_ring = bytearray(_HEADER_SIZE + CAPACITY * RECORD_SIZE)
+_head = 0
+_count = 0
+
+
+def _write(event: int, a: int = 0, b: int = 0):
+    global _head, _count
+    ustruct.pack_into(
+        RECORD_FORMAT,
+        _ring,
+        _HEADER_SIZE + _head * RECORD_SIZE,
+        event,
+        utime.ticks_ms() & 0xFFFF,
+        a,
+        b,
+    )
+    _head = (_head + 1) % CAPACITY
+    if _count < CAPACITY:
+        _count += 1
+
+
+def _drop(event: int, a: int = 0, b: int = 0):
+    pass
+
+
+debug = _write if LEVEL <= DEBUG else _drop
+info = _write if LEVEL <= INFO else _drop
+warning = _write if LEVEL <= WARNING else _drop
+error = _write if LEVEL <= ERROR else _drop
+
+
+def errno(e: Exception) -> int:
+    if e.args and isinstance(e.args[0], int):
+        return e.args[0]
+    return 0
+
+
+def load(data: bytes):
+    global _head, _count
+    # anything that doesn't fit (e.g. RTC-RAM written by older firmware)
+    # starts a fresh ring
+    if len(data) != len(_ring):
+        clear()
+        return
+    _ring[:] = data
+    _head, _count = ustruct.unpack_from(_HEADER_FORMAT, _ring, 0)
+    if _head >= CAPACITY or _count > CAPACITY:
+        clear()
+
+
+def save() -> bytes:
+    ustruct.pack_into(_HEADER_FORMAT, _ring, 0, _head, _count)
+    return bytes(_ring)
+
+
+def clear():
+    global _head, _count
+    _head = 0
+    _count = 0
+
+
+def records():
+    # oldest first
+    for i in range(_count):
+        index = (_head - _count + i) % CAPACITY
+        yield ustruct.unpack_from(RECORD_FORMAT, _ring, _HEADER_SIZE + index * RECORD_SIZE)
+
+
+def export() -> bytes:
+    # records oldest first without header, as uploaded to the backend
+    start = (_head - _count) % CAPACITY
+    body = memoryview(_ring)[_HEADER_SIZE:]
+    if start + _count <= CAPACITY:
+        return bytes(body[start * RECORD_SIZE : (start + _count) * RECORD_SIZE])
+    return bytes(body[start * RECORD_SIZE :]) + bytes(body[: _head * RECORD_SIZE])
+
+
+def dump():
+    for event, ms, a, b in records():
+        print("{:5d} {:20s} {} {}".format(ms, NAMES.get(event, str(event)), a, b))
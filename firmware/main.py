@@ -11,6 +11,7 @@ import utime
 
 import captive_bvg
 import exposure_notification
+import log
 import util
 import uuurequests
 
@@ -18,16 +19,16 @@ import config
 
 
 def connectWLAN(name: str, passphrase: str) -> bool:
-    util.syslog("Wifi", "Connecting...")
+    log.debug(log.WIFI_CONNECT)
     wlan.connect(name, passphrase)
     connect_delay_counter = 0
     while not wlan.isconnected():
         if connect_delay_counter > 100 * config.WIFI_CONNECT_TIMEOUT:
-            util.syslog("Wifi", "Timeout.")
+            log.warning(log.WIFI_TIMEOUT)
             return False
         connect_delay_counter = connect_delay_counter + 1
         utime.sleep_ms(10)
-    util.syslog("Wifi", "Connected.")
+    log.info(log.WIFI_CONNECTED)
     return True
 
 
@@ -41,7 +42,7 @@ def bleInterruptHandler(event: int, data):
             beacons[bytes(adv_data)[11:31]] = rssi
 
     if event == util.IRQ_SCAN_DONE:
-        util.syslog("BLE", "Scan done, stopping Bluetooth...")
+        log.debug(log.BLE_DONE, len(beacons))
         ble.active(False)
         ble_scan_done = True
         return
@@ -54,25 +55,29 @@ otaCounter = 0
 emptyWifiCounter = 0
 extendSleep = False
 needsUpload = False
+logsRequested = False
+rtcMemory = b""
+rtcCounters = b""
 
 try:
-    machine.freq(80000000)
+    # RTC-RAM holds the counters followed by the log ring buffer
+    rtc = machine.RTC()
+    rtcMemory = rtc.memory()
+    rtcCounters = rtcMemory[:3]
+    log.load(rtcMemory[3:])
 
-    util.syslog(
-        "Machine", "Firmware {} - Client {}".format(FIRMWARE_VERSION, config.CLIENT_ID)
-    )
+    machine.freq(80000000)
 
-    util.syslog("RTC", "Init...")
-    rtc = machine.RTC()
+    log.info(log.BOOT, config.CLIENT_ID, machine.reset_cause())
 
     # RTC-RAM is empty after a real reboot (no deepsleep)
-    if len(rtc.memory()) == 0:
-        util.syslog("RTC", "RTC-RAM clean...")
+    if len(rtcMemory) == 0:
+        log.info(log.RTC_CLEAN)
         needsUpload = True
     else:
         # RTC-RAM not empty, get stored values
-        wakeupCounter, otaCounter, emptyWifiCounter = ustruct.unpack(
-            ">3B", rtc.memory()
+        wakeupCounter, otaCounter, emptyWifiCounter = ustruct.unpack_from(
+            ">3B", rtcMemory
         )
 
     wakeupCounter += 1
@@ -86,11 +91,10 @@ try:
     gc.collect()
 
     beacons = {}
-    util.syslog("BLE", "Starting Bluetooth...")
+    log.debug(log.BLE_START)
     ble = ubluetooth.BLE()
     ble.active(True)
     ble.irq(bleInterruptHandler)
-    util.syslog("BLE", "Scanning...")
     ble.gap_scan(
         util.second_to_millisecond(config.SCAN_TIME),
         util.second_to_microsecond(config.SCAN_TIME),
@@ -105,7 +109,7 @@ try:
 
     gc.collect()
 
-    util.syslog("Wifi", "Starting Wifi...")
+    log.debug(log.WIFI_START)
     wlan = network.WLAN(network.STA_IF)
     wlan.active(True)
     wlan.disconnect()
@@ -114,9 +118,10 @@ try:
     except Exception:
         nets = []
     if not needsUpload:
-        util.syslog("Wifi", "Stopping Wifi...")
+        log.debug(log.WIFI_STOP)
         wlan.active(False)
     nets = util.removeIgnoredSSIDs(nets)
+    log.debug(log.WIFI_SCANNED, len(nets))
 
     gc.collect()
 
@@ -157,16 +162,16 @@ try:
 
     gc.collect()
 
-    util.syslog("Storage", "Storing...")
+    log.debug(log.STORAGE_STORE, len(framePayload))
     try:
         with util.openFile("v1.db") as f:
             db = btree.open(f)
             db[str(ubinascii.crc32(framePayload))] = framePayload
             db.close()
     except Exception as e:
-        util.syslog("Storage", "Failed with error: {}".format(e))
+        log.error(log.STORAGE_ERROR, log.errno(e))
         pass
-    util.syslog("Storage", "Done.")
+    log.debug(log.STORAGE_DONE)
 
     gc.collect()
 
@@ -179,10 +184,10 @@ try:
                 has_web_connection = captive_bvg.accept_captive_portal()
                 gc.collect()
             except Exception:
-                util.syslog("Network", "Problem checking online status")
+                log.warning(log.NETWORK_ERROR)
 
             if has_web_connection:
-                util.syslog("Network", "We should have a web connection")
+                log.info(log.NETWORK_ONLINE)
 
                 # sync time over NTP
                 util.syncTime()
@@ -199,7 +204,7 @@ try:
                     gc.collect()
                     otaCounter = 0
 
-                util.syslog("Upload", "Uploading stored measurements...")
+                log.debug(log.UPLOAD_START)
 
                 try:
                     f = util.openFile("v1.db")
@@ -238,18 +243,17 @@ try:
                         packetPayload += checksum
                         gc.collect()
 
-                        util.syslog(
-                            "Upload", "Uploading {} bytes...".format(len(packetPayload))
-                        )
-                        returnedChecksum = uuurequests.post(
-                            config.UPLOAD_URL, data=packetPayload
-                        ).content
+                        log.info(log.UPLOAD_PACKET, len(packetPayload), len(doneFrames))
+                        response = uuurequests.post(config.UPLOAD_URL, data=packetPayload)
+                        returnedChecksum = response.content
+                        if response.headers.get("Upload-Logs") == "1":
+                            logsRequested = True
                         gc.collect()
 
                         if checksum != returnedChecksum:
                             raise Exception("Checksum mismatch!")
 
-                        util.syslog("Upload", "Successful, deleting frames...")
+                        log.info(log.UPLOAD_DONE, len(doneFrames))
                         for frame in doneFrames:
                             del db[frame]
 
@@ -259,46 +263,43 @@ try:
                     otaCounter += 1
 
                 except Exception as e:
-                    util.syslog(
-                        "Upload", "Upload failed with error '{}', skipping...".format(e)
-                    )
+                    log.error(log.UPLOAD_ERROR, log.errno(e))
 
                 finally:
-                    util.syslog("Storage", "Flushing database...")
+                    log.debug(log.STORAGE_FLUSH)
                     db.close()
                     f.close()
 
+                # upload log records if requested by the backend
+                if logsRequested:
+                    util.uploadLogs()
+                    gc.collect()
+
             else:
-                util.syslog("Network", "Looks like we have no real connection")
+                log.warning(log.NETWORK_OFFLINE)
         else:
-            util.syslog("Upload", "no connection, can't upload...")
+            log.warning(log.UPLOAD_NO_CONNECTION)
 
     if wakeupCounter <= config.WAKEUP_THRESHOLD:
-        util.syslog(
-            "Machine",
-            "{} remaining wakeups until we try to upload...".format(
-                config.WAKEUP_THRESHOLD - wakeupCounter + 1
-            ),
-        )
+        log.debug(log.UPLOAD_PENDING, config.WAKEUP_THRESHOLD - wakeupCounter + 1)
     else:
-        util.syslog(
-            "Machine",
-            "Upload failed for {} tries, trying next time again.".format(
-                wakeupCounter - config.WAKEUP_THRESHOLD
-            ),
-        )
-    rtc.memory(ustruct.pack(">3B", wakeupCounter, otaCounter, emptyWifiCounter))
+        log.warning(log.UPLOAD_OVERDUE, wakeupCounter - config.WAKEUP_THRESHOLD)
+    rtcCounters = ustruct.pack(">3B", wakeupCounter, otaCounter, emptyWifiCounter)
 
 except Exception as e:
-    util.syslog("Machine", "General error: {}".format(e))
+    log.error(log.GENERAL_ERROR, log.errno(e))
 
 
 sleepTime = config.SLEEP_TIME
 if extendSleep:
     sleepTime = config.EXTENDED_SLEEP_TIME
 
-util.syslog(
-    "Machine",
-    "Going to sleep for {} seconds...".format(sleepTime),
-)
+log.info(log.SLEEP, sleepTime)
+
+# without counters (clean boot that failed early) nothing is stored, as before
+try:
+    if len(rtcCounters) == 3:
+        rtc.memory(rtcCounters + log.save())
+except Exception:
+    pass
 machine.deepsleep(util.second_to_millisecond(sleepTime))
@@ -8,6 +8,7 @@ import utime
 import uuurequests
 
 import config
+import log
 
 
 IRQ_SCAN_RESULT = const(5)
@@ -76,10 +77,6 @@ def now() -> int:
     return utime.time() + EPOCH_OFFSET
 
 
-def syslog(categorie: str, message: str):
-    print("-- [{}] -- {}".format(categorie, message))
-
-
 def openFile(filename: str):
     try:
         return open(filename, "r+b")
@@ -90,9 +87,9 @@ def openFile(filename: str):
 def syncTime():
     try:
         ntptime.settime()
-        syslog("Time", "Synced via NTP.")
+        log.info(log.TIME_SYNCED)
     except Exception as e:
-        syslog("Time", "Error getting NTP: {}".format(e))
+        log.warning(log.TIME_ERROR, log.errno(e))
 
 
 def otaUpdateConfig():
@@ -107,11 +104,25 @@ def otaUpdateConfig():
             with openFile("new_config.py") as f:
                 f.write(r.content)
             uos.rename("new_config.py", "config.py")
-            syslog("OTA", "Updated config.py")
+            log.info(log.OTA_UPDATED)
         else:
-            syslog("OTA", "Hash mismatch, cowardly refusing to install update!")
+            # cowardly refusing to install update
+            log.warning(log.OTA_HASH_MISMATCH, r.status_code)
+    except Exception as e:
+        log.warning(log.OTA_ERROR, log.errno(e))
+
+
+def uploadLogs():
+    try:
+        records = log.export()
+        r = uuurequests.post(
+            "{}?client_id={}".format(config.LOG_URL, config.CLIENT_ID), data=records
+        )
+        if r.status_code == 200:
+            log.clear()
+            log.info(log.LOG_UPLOADED, len(records) // log.RECORD_SIZE)
     except Exception as e:
-        syslog("OTA", "Error getting updates: {}".format(e))
+        log.warning(log.LOG_UPLOAD_ERROR, log.errno(e))
 
 
 def prepareDepotWifiSets():
@@ -0,0 +1,358 @@
+"""Links uploaded beacons to published diagnosis keys.
+
+Every Temporary Exposure Key is expanded into its Rolling Proximity
+Identifiers (see the Exposure Notification cryptography specification) and
+the RPIs are indexed per day. New beacons are looked up in that index and
+new keys are matched against the beacons already stored for their days.
+Matching `key_id`s are written back to `beacons` in bulk.
+
+Keys carry their intervals in `rolling_start_interval_number` if the
+importer stored it. Diagnosis keys are published after their validity day,
+so for keys without it every day of the retention window before
+`import_date` is derived, which costs correspondingly more.
+"""
+import argparse
+import logging
+import os
+import struct
+import time
+from multiprocessing import Pool, cpu_count
+
+import psycopg2
+import psycopg2.extras
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+RPIK_INFO = b"EN-RPIK"
+RPI_PADDING = b"EN-RPI" + bytes(6)
+RPI_SIZE = 16
+
+INTERVAL_SECONDS = 600  # one ENIntervalNumber
+INTERVALS_PER_DAY = 144
+SECONDS_PER_DAY = 86400
+
+log = logging.getLogger("matcher")
+
+
+def deriveRPIs(batch: list) -> list:
+    """Expand (key_id, tek, rolling_start, rolling_period) tuples into
+    (key_id, rolling_start, rpis) where rpis holds all RPIs back to back."""
+    results = []
+    for keyID, tek, rollingStart, rollingPeriod in batch:
+        rpik = HKDF(
+            algorithm=hashes.SHA256(), length=16, salt=None, info=RPIK_INFO
+        ).derive(tek)
+        blocks = b"".join(
+            RPI_PADDING + struct.pack("<I", rollingStart + i)
+            for i in range(rollingPeriod)
+        )
+        encryptor = Cipher(algorithms.AES(rpik), modes.ECB()).encryptor()
+        results.append(
+            (keyID, rollingStart, encryptor.update(blocks) + encryptor.finalize())
+        )
+    return results
+
+
+class RPIIndex:
+    """Maps RPIs to key IDs, bucketed by UTC day."""
+
+    def __init__(self):
+        self.days = {}
+
+    def add(self, keyID: int, rollingStart: int, rpis: bytes):
+        for i in range(len(rpis) // RPI_SIZE):
+            day = (rollingStart + i) // INTERVALS_PER_DAY
+            bucket = self.days.get(day)
+            if bucket is None:
+                bucket = self.days[day] = {}
+            bucket[rpis[i * RPI_SIZE : (i + 1) * RPI_SIZE]] = keyID
+
+    def lookup(self, rpi: bytes, timestamp: int):
+        # RPIs may be seen up to two hours outside their interval, so the
+        # neighbouring days are checked as well
+        day = timestamp // SECONDS_PER_DAY
+        for d in (day, day - 1, day + 1):
+            bucket = self.days.get(d)
+            if bucket is not None and rpi in bucket:
+                return bucket[rpi]
+        return None
+
+    def dayRange(self) -> tuple:
+        return min(self.days), max(self.days)
+
+    def evict(self, oldestDay: int):
+        for day in [d for d in self.days if d < oldestDay]:
+            del self.days[day]
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self.days.values())
+
+
+def deriveInto(pool: Pool, index: RPIIndex, keys: list, batchSize: int):
+    batches = [keys[i : i + batchSize] for i in range(0, len(keys), batchSize)]
+    for results in pool.imap_unordered(deriveRPIs, batches):
+        for keyID, rollingStart, rpis in results:
+            index.add(keyID, rollingStart, rpis)
+
+
+def matchBeacons(index: RPIIndex, rows) -> list:
+    """Return (beacon_id, key_id) pairs for (beacon_id, data, timestamp) rows."""
+    matches = []
+    for beaconID, data, timestamp in rows:
+        try:
+            rpi = bytes.fromhex(data[: 2 * RPI_SIZE])
+        except (TypeError, ValueError):
+            continue
+        keyID = index.lookup(rpi, timestamp)
+        if keyID is not None:
+            matches.append((beaconID, keyID))
+    return matches
+
+
+def fetchKeys(cur, where: str, params: tuple, oldestInterval: int, retentionDays: int) -> tuple:
+    """Return usable (key_id, tek, rolling_start, rolling_period) tuples that
+    are still valid at oldestInterval, and the highest key ID handled."""
+    cur.execute(
+        """SELECT id, data, rolling_start_interval_number, rolling_period,
+            import_date - DATE '1970-01-01'
+        FROM keys
+        WHERE """
+        + where
+        + " ORDER BY id",
+        params,
+    )
+
+    # RPIs before this are evicted from the index anyway
+    firstInterval = (oldestInterval // INTERVALS_PER_DAY - 1) * INTERVALS_PER_DAY
+
+    keys = []
+    lastKeyID = None
+    expanded = 0
+    for keyID, data, rollingStart, rollingPeriod, importDay in cur:
+        if rollingStart is None:
+            if importDay is None:
+                # the watermark stays before this key, so it is read again
+                # once one of the columns is filled in
+                log.warning("Key %d has no rolling_start_interval_number and no import_date, stopping", keyID)
+                break
+            rollingStart = (importDay - retentionDays) * INTERVALS_PER_DAY
+            rollingPeriod = (retentionDays + 1) * INTERVALS_PER_DAY
+            expanded += 1
+        lastKeyID = keyID
+
+        if rollingStart + rollingPeriod <= firstInterval:
+            continue
+        if rollingStart < firstInterval:
+            rollingPeriod -= firstInterval - rollingStart
+            rollingStart = firstInterval
+        try:
+            tek = bytes.fromhex(data)
+        except (TypeError, ValueError):
+            log.warning("Key %d is not valid hex, skipping", keyID)
+            continue
+        if len(tek) != 16:
+            log.warning("Key %d is malformed, skipping", keyID)
+            continue
+        keys.append((keyID, tek, rollingStart, rollingPeriod))
+
+    if expanded:
+        log.info("Expanded %d keys without rolling_start_interval_number over %d days", expanded, retentionDays + 1)
+    return keys, lastKeyID
+
+
+def storeMatches(cur, matches: list):
+    psycopg2.extras.execute_values(
+        cur,
+        """UPDATE beacons SET key_id = v.key_id
+        FROM (VALUES %s) AS v (id, key_id)
+        WHERE beacons.id = v.id""",
+        matches,
+        page_size=1000,
+    )
+
+
+class Matcher:
+    def __init__(self, conn, pool: Pool, retentionDays: int, settle: int, batchSize: int):
+        self.conn = conn
+        self.pool = pool
+        self.retentionDays = retentionDays
+        self.settle = settle
+        self.batchSize = batchSize
+        self.index = RPIIndex()
+
+        with conn, conn.cursor() as cur:
+            self.loadState(cur)
+
+            # keys up to last_key_id are already matched against stored
+            # beacons, they only have to be indexed for incoming ones
+            keys, _ = fetchKeys(
+                cur, "id <= %s", (self.lastKeyID,), self.oldestInterval(), self.retentionDays
+            )
+        self.derive(self.index, keys)
+        log.info("Indexed %d keys (%d RPIs)", len(keys), len(self.index))
+
+    def loadState(self, cur):
+        cur.execute("SELECT last_key_id, last_received_timestamp FROM matcher_state")
+        self.lastKeyID, self.lastReceivedTimestamp = cur.fetchone()
+
+    def reconnect(self):
+        self.conn.close()
+        self.conn = psycopg2.connect(os.environ["DATABASE_URL"])
+        # the index may already contain keys from the failed step, adding
+        # them again is harmless
+        with self.conn, self.conn.cursor() as cur:
+            self.loadState(cur)
+
+    def oldestInterval(self) -> int:
+        return int(time.time()) // INTERVAL_SECONDS - self.retentionDays * INTERVALS_PER_DAY
+
+    def derive(self, index: RPIIndex, keys: list):
+        deriveInto(self.pool, index, keys, self.batchSize)
+
+    def matchNewKeys(self, cur) -> int:
+        keys, lastKeyID = fetchKeys(
+            cur, "id > %s", (self.lastKeyID,), self.oldestInterval(), self.retentionDays
+        )
+        if lastKeyID is not None:
+            self.lastKeyID = lastKeyID
+        if not keys:
+            return 0
+
+        fresh = RPIIndex()
+        self.derive(fresh, keys)
+
+        matched = 0
+        if fresh.days:
+            firstDay, lastDay = fresh.dayRange()
+            with self.conn.cursor(name="matcher_beacons") as beacons:
+                beacons.itersize = 10000
+                # frames.timestamp is UTC wall-clock time without zone
+                beacons.execute(
+                    """SELECT b.id, b.data, EXTRACT(EPOCH FROM f.timestamp)::BIGINT
+                    FROM frames f
+                    JOIN beacons b ON b.frame_id = f.id
+                    WHERE f.timestamp >= to_timestamp(%s) AT TIME ZONE 'UTC'
+                    AND f.timestamp < to_timestamp(%s) AT TIME ZONE 'UTC'
+                    AND f.received_timestamp <= %s
+                    AND b.key_id IS NULL""",
+                    (
+                        (firstDay - 1) * SECONDS_PER_DAY,
+                        (lastDay + 2) * SECONDS_PER_DAY,
+                        self.lastReceivedTimestamp,
+                    ),
+                )
+                matches = matchBeacons(fresh, beacons)
+            storeMatches(cur, matches)
+            matched = len(matches)
+
+        for day, bucket in fresh.days.items():
+            self.index.days.setdefault(day, {}).update(bucket)
+
+        log.info("Indexed %d new keys, %d stored beacons matched", len(keys), matched)
+        return matched
+
+    def matchNewBeacons(self, cur) -> int:
+        # Beacon IDs are assigned before their ingest transaction commits, so
+        # they can't serve as watermark. Frames carry the transaction start as
+        # received_timestamp, those older than the settle window are
+        # committed (see refresh_frame_rollups() in schema.sql).
+        cur.execute("SELECT NOW() - %s * INTERVAL '1 second'", (self.settle,))
+        (upto,) = cur.fetchone()
+        if upto <= self.lastReceivedTimestamp:
+            return 0
+
+        with self.conn.cursor(name="matcher_new_beacons") as beacons:
+            beacons.itersize = 10000
+            beacons.execute(
+                """SELECT b.id, b.data, EXTRACT(EPOCH FROM f.timestamp)::BIGINT
+                FROM frames f
+                JOIN beacons b ON b.frame_id = f.id
+                WHERE f.received_timestamp > %s AND f.received_timestamp <= %s""",
+                (self.lastReceivedTimestamp, upto),
+            )
+            matches = matchBeacons(self.index, beacons)
+        storeMatches(cur, matches)
+        matched = len(matches)
+        self.lastReceivedTimestamp = upto
+
+        if matched:
+            log.info("%d new beacons matched", matched)
+        return matched
+
+    def step(self) -> int:
+        # matches and watermarks are committed together, a crash simply
+        # repeats the step
+        with self.conn, self.conn.cursor() as cur:
+            matched = self.matchNewKeys(cur) + self.matchNewBeacons(cur)
+            cur.execute(
+                """UPDATE matcher_state SET
+                    last_key_id = %s,
+                    last_received_timestamp = %s""",
+                (self.lastKeyID, self.lastReceivedTimestamp),
+            )
+
+        self.index.evict(self.oldestInterval() // INTERVALS_PER_DAY - 1)
+        return matched
+
+
+def run(args):
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    with Pool(args.workers) as pool:
+        matcher = Matcher(conn, pool, args.retention_days, args.settle, args.batch_size)
+        while True:
+            try:
+                matcher.step()
+            except psycopg2.Error as e:
+                log.error("Matching failed: %s", e)
+                matcher.reconnect()
+            time.sleep(args.interval)
+
+
+def bench(args):
+    firstInterval = int(time.time()) // INTERVAL_SECONDS // INTERVALS_PER_DAY * INTERVALS_PER_DAY
+    keys = [
+        (i, os.urandom(16), firstInterval - (i % 14) * INTERVALS_PER_DAY, INTERVALS_PER_DAY)
+        for i in range(args.keys)
+    ]
+
+    for workers in sorted({1, args.workers}):
+        with Pool(workers) as pool:
+            index = RPIIndex()
+            start = time.perf_counter()
+            deriveInto(pool, index, keys, args.batch_size)
+            elapsed = time.perf_counter() - start
+
+        keysPerSecond = len(keys) / elapsed
+        print(
+            "{:2d} workers: {:9.0f} keys/s {:9.0f} keys/s/core ({} RPIs in {:.2f}s)".format(
+                workers, keysPerSecond, keysPerSecond / workers, len(index), elapsed
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=cpu_count())
+    parser.add_argument("--batch-size", type=int, default=256, help="keys per worker task")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    runParser = subparsers.add_parser("run", help="match continuously (uses DATABASE_URL)")
+    runParser.add_argument("--interval", type=int, default=60, help="seconds between steps")
+    runParser.add_argument("--retention-days", type=int, default=14)
+    runParser.add_argument(
+        "--settle", type=int, default=60, help="seconds until received frames are considered committed"
+    )
+    runParser.set_defaults(func=run)
+
+    benchParser = subparsers.add_parser("bench", help="measure RPI derivation throughput")
+    benchParser.add_argument("--keys", type=int, default=20000)
+    benchParser.set_defaults(func=bench)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
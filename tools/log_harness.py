@@ -0,0 +1,207 @@
+"""Host harness for firmware/log.py.
+
+Replays the log calls of one wake (with upload) through the old print-based
+syslog and through the binary ring buffer and reports time and allocations
+per wake. Run it with the MicroPython unix port to get numbers from the
+firmware's allocator, CPython works as well:
+
+    micropython tools/log_harness.py
+    python3 tools/log_harness.py [--wakes 1000]
+
+Serial output is not written anywhere, the time a blocking UART write would
+take is added from the number of bytes printed.
+
+Uploaded logs (client_logs.data) can be decoded with
+
+    python3 tools/log_harness.py decode <file>
+"""
+import gc
+import sys
+
+try:
+    import micropython  # noqa: F401
+
+    MICROPYTHON = True
+except ImportError:
+    import struct
+    import time
+    import types
+
+    MICROPYTHON = False
+    sys.modules["micropython"] = types.SimpleNamespace(const=lambda x: x)
+    sys.modules["ustruct"] = struct
+    sys.modules["utime"] = types.SimpleNamespace(
+        ticks_ms=lambda: time.monotonic_ns() // 1000000
+    )
+
+import utime  # noqa: E402
+
+_here = __file__.rsplit("/", 1)[0] if "/" in __file__ else "."
+sys.path.insert(0, _here + "/../firmware")
+import log  # noqa: E402
+
+UART_BAUD = 115200
+UART_BITS_PER_BYTE = 10
+
+# (category, message, message arguments, level, event, record arguments)
+# following one wake of firmware/main.py that uploads a packet
+WAKE = [
+    ("Machine", "Firmware {} - Client {}", ("v1.2.0", 1337), log.INFO, log.BOOT, (1337, 4)),
+    ("RTC", "Init...", (), log.DEBUG, None, ()),
+    ("BLE", "Starting Bluetooth...", (), log.DEBUG, log.BLE_START, ()),
+    ("BLE", "Scanning...", (), log.DEBUG, None, ()),
+    ("BLE", "Scan done, stopping Bluetooth...", (), log.DEBUG, log.BLE_DONE, (12,)),
+    ("Wifi", "Starting Wifi...", (), log.DEBUG, log.WIFI_START, ()),
+    ("Wifi", "", (), log.DEBUG, log.WIFI_SCANNED, (5,)),
+    ("Storage", "Storing...", (), log.DEBUG, log.STORAGE_STORE, (299,)),
+    ("Storage", "Done.", (), log.DEBUG, log.STORAGE_DONE, ()),
+    ("Wifi", "Connecting...", (), log.DEBUG, log.WIFI_CONNECT, ()),
+    ("Wifi", "Connected.", (), log.INFO, log.WIFI_CONNECTED, ()),
+    ("Captive Portal BVG", "No captive portal in place", (), log.INFO, log.PORTAL_NONE, ()),
+    ("Network", "We should have a web connection", (), log.INFO, log.NETWORK_ONLINE, ()),
+    ("Time", "Synced via NTP.", (), log.INFO, log.TIME_SYNCED, ()),
+    ("Upload", "Uploading stored measurements...", (), log.DEBUG, log.UPLOAD_START, ()),
+    ("Upload", "Uploading {} bytes...", (3027,), log.INFO, log.UPLOAD_PACKET, (3027, 11)),
+    ("Upload", "Successful, deleting frames...", (), log.INFO, log.UPLOAD_DONE, (11,)),
+    ("Storage", "Flushing database...", (), log.DEBUG, log.STORAGE_FLUSH, ()),
+    ("Machine", "{} remaining wakeups until we try to upload...", (11,), log.DEBUG, log.UPLOAD_PENDING, (11,)),
+    ("Machine", "Going to sleep for {} seconds...", (60,), log.INFO, log.SLEEP, (60,)),
+]
+
+
+class Sink:
+    """Stands in for the UART, counts the bytes written."""
+
+    def __init__(self):
+        self.written = 0
+
+    def write(self, s):
+        self.written += len(s)
+        return len(s)
+
+    def flush(self):
+        pass
+
+
+def syslog(categorie: str, message: str):
+    # util.syslog before the binary log
+    print("-- [{}] -- {}".format(categorie, message))
+
+
+def wakeSyslog():
+    for categorie, message, args, _, _, _ in WAKE:
+        if message:
+            syslog(categorie, message.format(*args))
+
+
+def wakeLog():
+    for _, _, _, level, event, args in WAKE:
+        if event is None:
+            continue
+        if level == log.DEBUG:
+            log.debug(event, *args)
+        elif level == log.INFO:
+            log.info(event, *args)
+        elif level == log.WARNING:
+            log.warning(event, *args)
+        else:
+            log.error(event, *args)
+
+
+def wakeLogAll():
+    for _, _, _, _, event, args in WAKE:
+        if event is not None:
+            log._write(event, *args)
+
+
+def wakeBaseline():
+    # the harness loop alone, to be subtracted from the rows above
+    for _, _, _, _, event, args in WAKE:
+        if event is not None:
+            log._drop(event, *args)
+
+
+def measureTime(wake, wakes: int) -> float:
+    # microseconds per wake
+    start = utime.ticks_us() if MICROPYTHON else time.perf_counter()
+    for _ in range(wakes):
+        wake()
+    if MICROPYTHON:
+        return utime.ticks_diff(utime.ticks_us(), start) / wakes
+    return (time.perf_counter() - start) * 1000000 / wakes
+
+
+def measureAlloc(wake) -> int:
+    # bytes allocated during one wake
+    if MICROPYTHON:
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        wake()
+        allocated = gc.mem_alloc() - before
+        gc.enable()
+        return allocated
+
+    import tracemalloc
+
+    tracemalloc.start()
+    wake()  # warm up caches
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    wake()
+    allocated = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return allocated
+
+
+def bench(wakes: int):
+    stdout = sys.stdout
+    results = []
+    for name, wake in (
+        ("syslog", wakeSyslog),
+        ("log (LEVEL={})".format(log.LEVEL), wakeLog),
+        ("log (all levels)", wakeLogAll),
+        ("harness loop", wakeBaseline),
+    ):
+        sink = Sink()
+        sys.stdout = sink
+        try:
+            allocated = measureAlloc(wake)
+            log.clear()
+            sink.written = 0
+            cpu = measureTime(wake, wakes)
+        finally:
+            sys.stdout = stdout
+        uart = sink.written / wakes * UART_BITS_PER_BYTE / UART_BAUD * 1000000
+        results.append((name, cpu, uart, sink.written // wakes, allocated))
+
+    print("per wake ({} wakes, UART at {} baud):".format(wakes, UART_BAUD))
+    print("{:18s} {:>10s} {:>10s} {:>10s} {:>10s}".format("", "cpu us", "uart us", "uart B", "alloc B"))
+    for name, cpu, uart, written, allocated in results:
+        print("{:18s} {:10.1f} {:10.1f} {:10d} {:10d}".format(name, cpu, uart, written, allocated))
+    print("ring buffer: {} records of {} bytes in RTC-RAM".format(log.CAPACITY, log.RECORD_SIZE))
+
+
+def decode(filename: str):
+    import ustruct
+
+    with open(filename, "rb") as f:
+        data = f.read()
+    for offset in range(0, len(data) - log.RECORD_SIZE + 1, log.RECORD_SIZE):
+        event, ms, a, b = ustruct.unpack_from(log.RECORD_FORMAT, data, offset)
+        print("{:5d} {:20s} {} {}".format(ms, log.NAMES.get(event, str(event)), a, b))
+
+
+def main():
+    args = sys.argv[1:]
+    if args and args[0] == "decode":
+        decode(args[1])
+        return
+
+    wakes = 1000
+    if len(args) == 2 and args[0] == "--wakes":
+        wakes = int(args[1])
+    bench(wakes)
+
+
+main()